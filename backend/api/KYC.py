@@ -1,28 +1,26 @@
 # backend/api/kyc.py
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from db import database, models
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import models
+from app.deps import get_db
 from schemas.schemas import KYCRequest
 
 router = APIRouter(prefix="/kyc", tags=["kyc"])
 
-# Dependency to get DB session
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/")
-def submit_kyc(req: KYCRequest, db: Session = Depends(get_db)):
+async def submit_kyc(req: KYCRequest, db: AsyncSession = Depends(get_db)):
     """
     Endpoint to submit a KYC form.
     Stores full name and government ID number in the database.
     """
     try:
         # Check for existing submission with same ID number
-        existing = db.query(models.KYCSubmission).filter(models.KYCSubmission.id_number == req.id_number).first()
+        existing = (
+            await db.execute(
+                select(models.KYCSubmission.id).where(models.KYCSubmission.id_number == req.id_number)
+            )
+        ).first()
         if existing:
             raise HTTPException(status_code=400, detail="KYC already submitted with this ID number.")
 
@@ -32,8 +30,8 @@ def submit_kyc(req: KYCRequest, db: Session = Depends(get_db)):
         )
 
         db.add(kyc_submission)
-        db.commit()
-        db.refresh(kyc_submission)
+        await db.commit()
+        await db.refresh(kyc_submission)
 
         return {"success": True, "message": "KYC submitted successfully", "kyc_id": kyc_submission.id}
 
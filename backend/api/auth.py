@@ -1,15 +1,23 @@
-from typing import Generator, Optional, Dict, Any
-from datetime import datetime, timedelta
-import os
+from typing import Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+import base64
+import hashlib
+import hmac
 import logging
+import threading
 
+from cachetools import TTLCache
 from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from passlib.context import CryptContext
-import jwt
+import orjson
 
-from db import models, database
+from app.config.security import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY
+from app.deps import get_claims, get_db  # noqa: F401 - get_claims re-exported for existing imports
+from db import models
 from schemas.schemas import LoginRequest
 
 # Router
@@ -18,41 +26,70 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 # Logger
 logger = logging.getLogger(__name__)
 
-# Password hashing context (bcrypt)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context: argon2id for new hashes; bcrypt hashes still verify and
+# are flagged by needs_update() so login can transparently rehash them.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated=["bcrypt"],
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=65536,
+    argon2__parallelism=1,
+)
+# Resolve the argon2 backend at import rather than on the first login
+pwd_context.handler("argon2").get_backend()
 
-# JWT / security settings (use environment variables in production)
-SECRET_KEY = os.getenv("SECRET_KEY", "change-me-in-production")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))  # 24h default
 
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
 
-def get_db() -> Generator[Session, None, None]:
-    """
-    Provide a database session and ensure it's closed after use.
-    Kept as a function so FastAPI can use it as a dependency.
-    """
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+_UTC = timezone.utc
+
+# Tokens are signed HS256 directly with hmac; the header segment never changes
+_SECRET_KEY_BYTES = SECRET_KEY.encode("utf-8")
+_JWT_HEADER_B64 = _b64url(orjson.dumps({"alg": ALGORITHM, "typ": "JWT"}))
+
+# Short-lived cache of password verification results so repeated logins from the
+# same account skip the KDF. Keys are HMAC(SECRET_KEY, plaintext, stored hash), so
+# neither value is kept in memory. The TTL must stay far below the token lifetime;
+# failures are only remembered for 2s so the cache never makes guessing cheaper.
+_verify_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+_verify_fail_cache: TTLCache = TTLCache(maxsize=10_000, ttl=2)
+_verify_cache_lock = threading.Lock()
+
+
+def _verify_cache_key(plain_password: str, hashed_password: str) -> bytes:
+    msg = plain_password.encode("utf-8") + b"\x00" + hashed_password.encode("utf-8")
+    return hmac.new(SECRET_KEY.encode("utf-8"), msg, hashlib.sha256).digest()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify a plaintext password against a hashed password.
     Returns False on verification errors instead of raising.
+    Results are cached briefly (see `_verify_cache`).
     """
+    key = _verify_cache_key(plain_password, hashed_password)
+    with _verify_cache_lock:
+        if key in _verify_cache:
+            return True
+        if key in _verify_fail_cache:
+            return False
+
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        ok = pwd_context.verify(plain_password, hashed_password)
     except Exception:
         logger.exception("Unexpected error while verifying password")
         return False
 
+    with _verify_cache_lock:
+        (_verify_cache if ok else _verify_fail_cache)[key] = True
+    return ok
+
 
 def hash_password(password: str) -> str:
-    """Hash a plaintext password (bcrypt)."""
+    """Hash a plaintext password (argon2id)."""
     return pwd_context.hash(password)
 
 
@@ -60,79 +97,97 @@ def create_access_token(subject: Dict[str, Any], expires_delta: Optional[timedel
     """
     Create a JWT access token. Subject should contain identifying data (e.g. id, username).
     The token includes iat and exp claims and a `sub` set to the subject id (string).
+    Encoded by hand (one orjson dump + one HMAC-SHA256); output is a standard HS256 JWT.
     """
-    now = datetime.utcnow()
+    now = datetime.now(_UTC)
     expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     payload = subject.copy()
-    payload.update({"iat": now, "exp": expire, "sub": str(subject.get("id", ""))})
+    payload.update({
+        "iat": int(now.timestamp()),
+        "exp": int(expire.timestamp()),
+        "sub": str(subject.get("id", "")),
+    })
     try:
-        token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+        signing_input = _JWT_HEADER_B64 + b"." + _b64url(orjson.dumps(payload))
     except Exception:
         logger.exception("Failed to encode JWT token")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Token generation failed")
-    # jwt.encode returns str in PyJWT >=2.0, bytes in some older libs — ensure string
-    return token if isinstance(token, str) else token.decode("utf-8")
+    signature = _b64url(hmac.new(_SECRET_KEY_BYTES, signing_input, hashlib.sha256).digest())
+    return (signing_input + b"." + signature).decode("ascii")
+
+
+# Login only needs these four columns; the statement is built once so SQLAlchemy
+# reuses its compiled form, and rows are returned as tuples instead of ORM objects.
+_LOGIN_STMT = select(
+    models.User.id,
+    models.User.username,
+    models.User.hashed_password,
+    models.User.password,
+).where(models.User.username == bindparam("u"))
 
 
 @router.post("/login")
-def login(req: LoginRequest, db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def login(req: LoginRequest, db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
     """
     Authenticate the user and return a JWT access token and safe user info.
 
     Notes:
-    - Supports both bcrypt-hashed passwords and legacy plaintext-stored passwords.
-    - If a legacy plaintext match is found and the model exposes a `hashed_password` attribute,
-      the plaintext will be re-hashed and stored (best-effort migration).
+    - Supports argon2/bcrypt-hashed passwords and legacy plaintext-stored passwords.
+    - If a legacy plaintext or bcrypt match is found, the password is re-hashed with argon2id
+      and stored (best-effort migration).
     - Keep a strong SECRET_KEY in production and avoid plaintext password storage.
     """
     # Fetch user by username (do not include password comparison in DB query to avoid leaking timing info)
-    user = db.query(models.User).filter(models.User.username == req.username).first()
+    row = (await db.execute(_LOGIN_STMT, {"u": req.username})).first()
 
     # Generic failure to avoid leaking whether username exists
-    if not user:
+    if row is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    user_id, username, hashed_password, legacy_password = row
 
-    # Prefer an explicit hashed field (if model has one) but fall back to legacy `password`
-    stored_password = getattr(user, "hashed_password", None) or getattr(user, "password", None)
+    # Prefer the hashed field but fall back to legacy `password`
+    stored_password = hashed_password or legacy_password
     if stored_password is None:
         logger.warning("Authentication attempted for user %s but no password field present", req.username)
         # Treat as invalid credentials to avoid account enumeration
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    # Determine whether stored_password looks like a bcrypt hash (common prefix $2b$, $2a$, $2y$)
+    # Hashes in any scheme known to pwd_context are verified via the KDF; anything else is legacy plaintext
     password_ok = False
-    if isinstance(stored_password, str) and stored_password.startswith("$2"):
-        password_ok = verify_password(req.password, stored_password)
+    needs_rehash = False
+    if isinstance(stored_password, str) and pwd_context.identify(stored_password) is not None:
+        # The KDF is CPU-bound; keep it off the event loop
+        password_ok = await run_in_threadpool(verify_password, req.password, stored_password)
+        needs_rehash = password_ok and pwd_context.needs_update(stored_password)
     else:
-        # Legacy / insecure: direct equality fallback. Accept but recommend migration.
-        password_ok = req.password == stored_password
+        # Legacy / insecure: constant-time equality fallback. Accept but recommend migration.
+        password_ok = hmac.compare_digest(req.password.encode("utf-8"), str(stored_password).encode("utf-8"))
         if password_ok:
             logger.warning("User %s authenticated using a plaintext-stored password. Recommend migrating to hashed storage.", req.username)
-            # Best-effort: if model supports hashed_password attribute, upgrade it
-            if hasattr(user, "hashed_password"):
-                try:
-                    user.hashed_password = hash_password(req.password)
-                    # Optionally remove or blank the legacy password if field exists
-                    if hasattr(user, "password"):
-                        try:
-                            setattr(user, "password", None)
-                        except Exception:
-                            # Not critical; just log
-                            logger.debug("Could not clear legacy password field for user %s", req.username)
-                    db.add(user)
-                    db.commit()
-                    logger.info("Upgraded user %s to hashed password storage", req.username)
-                except Exception:
-                    db.rollback()
-                    logger.exception("Failed to migrate user %s password to hashed storage", req.username)
+            needs_rehash = True
+
+    # Best-effort: upgrade plaintext and deprecated (bcrypt) hashes, clearing the legacy column
+    if needs_rehash:
+        try:
+            new_hash = await run_in_threadpool(hash_password, req.password)
+            await db.execute(
+                update(models.User)
+                .where(models.User.id == user_id)
+                .values(hashed_password=new_hash, password=None)
+            )
+            await db.commit()
+            logger.info("Upgraded user %s to argon2 password storage", req.username)
+        except Exception:
+            await db.rollback()
+            logger.exception("Failed to migrate user %s password to argon2 storage", req.username)
 
     if not password_ok:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
     # Build token payload and response-safe user object
-    token_payload = {"id": user.id, "username": user.username}
+    token_payload = {"id": user_id, "username": username}
     access_token = create_access_token(token_payload)
 
-    safe_user = {"id": user.id, "username": user.username}
+    safe_user = {"id": user_id, "username": username}
 
     return {"success": True, "access_token": access_token, "token_type": "bearer", "user": safe_user}
@@ -1,28 +1,79 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import asyncio
 import logging
-from typing import Dict, List, Optional
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, status
+import orjson
+from fastapi.responses import Response
 from pydantic import BaseModel
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import database, models
+from app.deps import get_db
+from db import models
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
 logger = logging.getLogger("sententialx.dashboard")
 
+# Optional columns are resolved once at import instead of on every request
+HAS_LAST_LOGIN = hasattr(models.User, "last_login")
+HAS_SEVERITY = hasattr(models.Threat, "severity")
+HAS_CREATED_AT = hasattr(models.Threat, "created_at")
 
-def get_db():
+RECENT_THREATS_LIMIT = 5
+
+_UTC = timezone.utc
+
+
+def _build_stats_query():
     """
-    Dependency that yields a database session and ensures it is closed after use.
+    Build one statement returning every dashboard aggregate in a single round-trip.
+
+    Each output row carries a `kind` discriminator:
+    - 'totals':   n = total threats, n_users = total users, n_active = active users (30d)
+    - 'severity': severity + n = count for that severity
+    - 'recent':   id/title/severity/created_at of one of the most recent threats
+    Sections whose columns are missing from the models are left out.
+
+    The placeholder NULLs in the first branch are cast explicitly: Postgres resolves
+    chained UNIONs pairwise, and untyped NULLs in the first two branches would be
+    resolved as text before the 'recent' branch (integer id, timestamptz) is reached.
     """
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    users = models.User.__table__.name
+    threats = models.Threat.__table__.name
+    active = "COUNT(*) FILTER (WHERE last_login >= :cutoff)" if HAS_LAST_LOGIN else "NULL::bigint"
+
+    ctes = [
+        f"t AS (SELECT COUNT(*) AS total FROM {threats})",
+        f"u AS (SELECT COUNT(*) AS total, {active} AS active FROM {users})",
+    ]
+    selects = [
+        "SELECT 'totals' AS kind, t.total AS n, u.total AS n_users, u.active AS n_active, "
+        "NULL::integer AS id, NULL::text AS title, NULL::text AS severity, "
+        "NULL::timestamptz AS created_at FROM t, u"
+    ]
+    if HAS_SEVERITY:
+        ctes.append(f"s AS (SELECT severity, COUNT(*) AS c FROM {threats} GROUP BY severity)")
+        selects.append("SELECT 'severity', c, NULL, NULL, NULL, NULL, severity, NULL FROM s")
+    if HAS_CREATED_AT:
+        severity = "severity" if HAS_SEVERITY else "NULL::text"
+        ctes.append(
+            f"r AS (SELECT id, title, {severity} AS severity, created_at FROM {threats} "
+            f"ORDER BY created_at DESC LIMIT {RECENT_THREATS_LIMIT})"
+        )
+        selects.append("SELECT 'recent', NULL, NULL, NULL, id, title, severity, created_at FROM r")
+
+    sql = "WITH " + ", ".join(ctes) + " " + " UNION ALL ".join(selects)
+    if HAS_CREATED_AT:
+        sql += " ORDER BY created_at DESC NULLS LAST"
+    return text(sql)
+
+
+_STATS_QUERY = _build_stats_query()
 
 
 class ThreatSummary(BaseModel):
@@ -40,8 +91,7 @@ class StatsResponse(BaseModel):
     recent_threats: Optional[List[ThreatSummary]] = None
 
 
-@router.get("/stats", response_model=StatsResponse, status_code=status.HTTP_200_OK)
-def get_stats(db: Session = Depends(get_db)):
+async def _compute_stats(db: AsyncSession) -> Dict[str, Any]:
     """
     Return a small set of dashboard statistics.
 
@@ -50,72 +100,74 @@ def get_stats(db: Session = Depends(get_db)):
     - active_users_30d: number of users active in the last 30 days (if `last_login` exists on User)
     - threats_by_severity: map of severity -> count (if `severity` exists on Threat)
     - recent_threats: up to 5 most recent threats with basic fields (if `created_at`/`title` exist)
+
+    All values come from a single query (see `_build_stats_query`).
     """
-    try:
-        # Basic totals (these should always exist)
-        total_threats = db.query(func.count(models.Threat.id)).scalar() or 0
-        total_users = db.query(func.count(models.User.id)).scalar() or 0
-
-        result = {
-            "total_threats": int(total_threats),
-            "total_users": int(total_users),
-            "active_users_30d": None,
-            "threats_by_severity": None,
-            "recent_threats": None,
-        }
-
-        # Attempt to compute active users in the last 30 days if the field exists
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        if hasattr(models.User, "last_login"):
-            try:
-                active_users_30d = (
-                    db.query(func.count(models.User.id))
-                    .filter(models.User.last_login >= thirty_days_ago)
-                    .scalar()
-                    or 0
-                )
-                result["active_users_30d"] = int(active_users_30d)
-            except Exception as e:
-                logger.debug("Could not compute active_users_30d: %s", e)
-
-        # Attempt to compute threats by severity if the field exists
-        if hasattr(models.Threat, "severity"):
-            try:
-                rows = (
-                    db.query(models.Threat.severity, func.count(models.Threat.id))
-                    .group_by(models.Threat.severity)
-                    .all()
-                )
-                # rows is list of (severity, count)
-                severity_map = {str(r[0]): int(r[1]) for r in rows}
-                result["threats_by_severity"] = severity_map
-            except Exception as e:
-                logger.debug("Could not compute threats_by_severity: %s", e)
-
-        # Attempt to fetch recent threats if basic fields exist
-        if hasattr(models.Threat, "created_at"):
-            try:
-                limit = 5
-                query = db.query(models.Threat).order_by(models.Threat.created_at.desc()).limit(limit)
-                threats = query.all()
-                recent = []
-                for t in threats:
-                    item = {
-                        "id": getattr(t, "id", None),
-                        "title": getattr(t, "title", None),
-                        "severity": getattr(t, "severity", None),
-                        "created_at": getattr(t, "created_at", None),
-                    }
-                    recent.append(item)
-                result["recent_threats"] = recent
-            except Exception as e:
-                logger.debug("Could not fetch recent_threats: %s", e)
-
-        return result
-
-    except Exception as exc:
-        logger.exception("Failed to fetch dashboard stats: %s", exc)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Unable to fetch dashboard statistics",
-        )
+    params = {}
+    if HAS_LAST_LOGIN:
+        # Minute resolution keeps the bound parameter stable across calls
+        now = datetime.now(_UTC)
+        params["cutoff"] = now.replace(second=0, microsecond=0) - timedelta(days=30)
+    rows = (await db.execute(_STATS_QUERY, params)).mappings().all()
+
+    result = {
+        "total_threats": 0,
+        "total_users": 0,
+        "active_users_30d": None,
+        "threats_by_severity": {} if HAS_SEVERITY else None,
+        "recent_threats": [] if HAS_CREATED_AT else None,
+    }
+    for row in rows:
+        kind = row["kind"]
+        if kind == "totals":
+            result["total_threats"] = int(row["n"] or 0)
+            result["total_users"] = int(row["n_users"] or 0)
+            if row["n_active"] is not None:
+                result["active_users_30d"] = int(row["n_active"])
+        elif kind == "severity":
+            result["threats_by_severity"][str(row["severity"])] = int(row["n"])
+        elif kind == "recent":
+            result["recent_threats"].append(
+                {
+                    "id": row["id"],
+                    "title": row["title"],
+                    "severity": row["severity"],
+                    "created_at": row["created_at"],
+                }
+            )
+    return result
+
+
+# Stats are global and change slowly, so one serialized copy is shared by all
+# callers for STATS_CACHE_TTL seconds. The lock makes concurrent misses wait for
+# a single recomputation instead of each hitting the database.
+STATS_CACHE_TTL = float(os.getenv("DASHBOARD_STATS_TTL", "10"))
+_stats_cache: Optional[Tuple[bytes, float]] = None
+_stats_lock = asyncio.Lock()
+
+
+@router.get("/stats", response_model=StatsResponse, status_code=status.HTTP_200_OK)
+async def get_stats(db: AsyncSession = Depends(get_db)):
+    """
+    Return dashboard statistics, served from a short-lived cache (see `_compute_stats`).
+    """
+    global _stats_cache
+
+    cached = _stats_cache
+    if cached is None or cached[1] <= time.monotonic():
+        async with _stats_lock:
+            cached = _stats_cache
+            if cached is None or cached[1] <= time.monotonic():
+                try:
+                    result = await _compute_stats(db)
+                except Exception as exc:
+                    logger.exception("Failed to fetch dashboard stats: %s", exc)
+                    raise HTTPException(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        detail="Unable to fetch dashboard statistics",
+                    )
+                # Validate and encode once; cache hits return the encoded bytes as-is
+                payload = orjson.dumps(StatsResponse(**result).dict())
+                cached = _stats_cache = (payload, time.monotonic() + STATS_CACHE_TTL)
+
+    return Response(content=cached[0], media_type="application/json")
@@ -1,21 +1,20 @@
 # backend/api/payments.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from db import database, models
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import models
+from app.deps import get_db
 from schemas.schemas import PaymentRequest
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
-# Dependency to get DB session
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/")
-def create_payment(req: PaymentRequest, db: Session = Depends(get_db)):
+async def create_payment(req: PaymentRequest, db: AsyncSession = Depends(get_db)):
     """
     Endpoint to create a new payment.
     Stores the payment amount and timestamp in the database.
@@ -23,14 +22,14 @@ def create_payment(req: PaymentRequest, db: Session = Depends(get_db)):
     try:
         payment = models.Payment(amount=req.amount)
         db.add(payment)
-        db.commit()
-        db.refresh(payment)
+        await db.commit()
+        await db.refresh(payment)
 
         return {
             "success": True,
             "payment": {
                 "id": payment.id,
-                "amount": payment.amount,
+                "amount": str(payment.amount),
                 "paid_at": payment.paid_at
             }
         }
@@ -38,17 +37,46 @@ def create_payment(req: PaymentRequest, db: Session = Depends(get_db)):
         print(f"Payment creation error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+# Only the serialized columns are selected; pages are ordered newest first (keyset on paid_at, id)
+_HISTORY_STMT = select(models.Payment.id, models.Payment.amount, models.Payment.paid_at).order_by(
+    models.Payment.paid_at.desc(), models.Payment.id.desc()
+)
+
+def _stream_payments(rows: Iterable) -> Iterator[bytes]:
+    """
+    Encode one page of payments row by row as {"payments": [...]}.
+    Amounts are exact decimal strings (e.g. "12.50"), as in create_payment.
+    """
+    yield b'{"payments":['
+    sep = b""
+    for payment_id, amount, paid_at in rows:
+        yield sep + orjson.dumps({"id": payment_id, "amount": str(amount), "paid_at": paid_at})
+        sep = b","
+    yield b"]}"
+
 @router.get("/history")
-def get_payment_history(db: Session = Depends(get_db)):
+async def get_payment_history(
+    before: Optional[datetime] = Query(None, description="`paid_at` of the last payment on the previous page (cursor)"),
+    before_id: Optional[int] = Query(None, description="`id` of the last payment on the previous page (cursor)"),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
     """
     Endpoint to fetch payment history.
-    Returns all payments ordered by most recent first.
+    Returns up to `limit` payments ordered by most recent first. Pass the `paid_at`
+    and `id` of the last returned payment as `before` / `before_id` to fetch the next
+    page; the id breaks ties between payments with the same `paid_at`.
     """
     try:
-        payments = db.query(models.Payment).order_by(models.Payment.paid_at.desc()).all()
-        return {"payments": [
-            {"id": p.id, "amount": p.amount, "paid_at": p.paid_at} for p in payments
-        ]}
+        stmt = _HISTORY_STMT
+        if before is not None and before_id is not None:
+            stmt = stmt.where(tuple_(models.Payment.paid_at, models.Payment.id) < tuple_(before, before_id))
+        elif before is not None:
+            stmt = stmt.where(models.Payment.paid_at < before)
+        # The page is fetched here because the session is released once the
+        # dependency exits, which may happen before the body is streamed.
+        rows = (await db.execute(stmt.limit(limit))).all()
     except Exception as e:
         print(f"Fetching payment history error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    return StreamingResponse(_stream_payments(rows), media_type="application/json")
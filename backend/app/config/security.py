@@ -0,0 +1,7 @@
+# backend/app/config/security.py
+import os
+
+# JWT / security settings (use environment variables in production)
+SECRET_KEY = os.getenv("SECRET_KEY", "change-me-in-production")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))  # 24h default
@@ -1,25 +1,53 @@
 # backend/app/controllers/auth_controller.py
 from app.models.user_session import UserSession
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import os
+import threading
 import uuid
 
-# Dummy in-memory store
-sessions = {}
+SESSION_TTL = timedelta(hours=2)
+
+# Multi-worker deployments need a shared store: set REDIS_URL to keep sessions in Redis.
+REDIS_URL = os.getenv("REDIS_URL")
+_redis = None
+if REDIS_URL:
+    import redis.asyncio as aioredis
+
+    _redis = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+# Single-process fallback: sessions are spread over shards, each with its own lock,
+# so concurrent logins/logouts only contend on 1/_SHARDS of the traffic.
+_SHARDS = 32
+_shards = [({}, threading.Lock()) for _ in range(_SHARDS)]
+
+def _shard(token: str):
+    return _shards[hash(token) % _SHARDS]
 
 async def login_user(username: str, password: str):
     # TODO: Integrate real authentication
     token = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
     session = UserSession(
         user_id=username,
         session_token=token,
-        created_at=datetime.utcnow(),
-        expires_at=datetime.utcnow() + timedelta(hours=2)
+        created_at=now,
+        expires_at=now + SESSION_TTL
     )
-    sessions[token] = session
+    if _redis is not None:
+        await _redis.setex(token, int(SESSION_TTL.total_seconds()), session.json())
+    else:
+        store, lock = _shard(token)
+        with lock:
+            store[token] = session
     return {"message": "Logged in", "session_token": token}
 
 async def logout_user(session_token: str):
-    if session_token in sessions:
-        del sessions[session_token]
+    if _redis is not None:
+        removed = await _redis.delete(session_token) > 0
+    else:
+        store, lock = _shard(session_token)
+        with lock:
+            removed = store.pop(session_token, None) is not None
+    if removed:
         return {"message": "Logged out"}
     return {"message": "Session not found"}
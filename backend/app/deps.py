@@ -0,0 +1,87 @@
+# backend/app/deps.py
+"""
+Shared FastAPI dependencies.
+
+Every router imports its dependencies from here so there is a single place
+that decides how sessions, connections and credentials are obtained.
+"""
+
+import threading
+import time
+from typing import Any, AsyncGenerator, Dict
+
+import jwt
+from cachetools import TTLCache
+from fastapi import Depends, Header, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.db import get_conn  # noqa: F401 - re-exported async (asyncpg) connection dependency
+from app.config.security import ALGORITHM, SECRET_KEY
+from db import database
+
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Yield an AsyncSession bound to the pooled engine and always return its
+    connection to the pool after the request.
+    """
+    async with database.SessionLocal() as db:
+        yield db
+
+
+# Verified claims for recently seen bearer tokens, so bursts of requests with the same
+# token skip signature verification. The full token string is the key: a truncated or
+# non-cryptographic hash would let a forged token collide with a cached valid one.
+# The 5s TTL bounds how long a revoked token keeps working; `exp` is still enforced.
+JWT_CACHE: TTLCache = TTLCache(maxsize=50_000, ttl=5)
+_jwt_cache_lock = threading.Lock()
+
+
+def get_claims(authorization: str = Header(...)) -> Dict[str, Any]:
+    """
+    Dependency returning the verified claims of the `Authorization: Bearer <token>` header.
+    The returned dict is shared with the cache and must be treated as read-only.
+    """
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    with _jwt_cache_lock:
+        claims = JWT_CACHE.get(token)
+    if claims is not None:
+        exp = claims.get("exp")
+        if exp is None or exp > time.time():
+            return claims
+
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    with _jwt_cache_lock:
+        JWT_CACHE[token] = claims
+    return claims
+
+
+def get_current_user(claims: Dict[str, Any] = Depends(get_claims)) -> Dict[str, Any]:
+    """
+    Dependency returning the authenticated user ({"id", "username"}) from the token claims,
+    without a database lookup.
+    """
+    try:
+        user_id = int(claims["sub"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token subject",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {"id": user_id, "username": claims.get("username")}
@@ -1 +1,57 @@
+# backend/db/models.py
+from sqlalchemy import Column, DateTime, Index, Integer, Numeric, String, func
+from sqlalchemy.orm import declarative_base
 
+Base = declarative_base()
+
+
+class User(Base):
+    __tablename__ = "users"
+    __table_args__ = (Index("ix_users_username", "username", unique=True),)
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String(150), nullable=False)
+    hashed_password = Column(String(255), nullable=True)
+    # Legacy plaintext column; cleared once a login migrates the user to hashed_password
+    password = Column(String(255), nullable=True)
+    last_login = Column(DateTime(timezone=True), nullable=True)
+
+
+class Threat(Base):
+    __tablename__ = "threats"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String(255), nullable=False)
+    severity = Column(String(32), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+# Serve the dashboard's "most recent threats" (index-only on Postgres via INCLUDE)
+# and per-severity counts without sequential scans.
+Index(
+    "ix_threats_created_at_desc",
+    Threat.created_at.desc(),
+    postgresql_include=["id", "title", "severity"],
+)
+Index("ix_threats_severity", Threat.severity)
+
+
+class KYCSubmission(Base):
+    __tablename__ = "kyc_submissions"
+
+    id = Column(Integer, primary_key=True)
+    full_name = Column(String(255), nullable=False)
+    id_number = Column(String(64), nullable=False, unique=True)
+
+
+class Payment(Base):
+    __tablename__ = "payments"
+
+    id = Column(Integer, primary_key=True)
+    amount = Column(Numeric(12, 2), nullable=False)
+    paid_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+# Keyset pagination for payment history:
+# WHERE (paid_at, id) < (:before, :before_id) ORDER BY paid_at DESC, id DESC
+Index("ix_payments_paid_at_desc_id", Payment.paid_at.desc(), Payment.id.desc())
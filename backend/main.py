@@ -4,33 +4,40 @@ backend/main.py
 Clean, robust FastAPI application entrypoint for Sentenial-X Backend.
 - Centralized configuration via pydantic BaseSettings
 - Structured logging
-- Safe, best-effort router imports with clear warnings if a module is missing
+- Explicit router imports; optional routers log a clear warning if missing
 - Health and root endpoints
 - Startup/shutdown lifecycle hooks for warming models and graceful shutdown
 - Configurable CORS origins via environment variable (comma-separated)
 """
 
-from typing import List, Optional
+from typing import List
 import os
 import logging
 import importlib
 import uvicorn
 
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseSettings
 
 # Optional DB/models import - attempt but fail gracefully
 _database = None
 _models = None
+_async_db = None
 
 try:
     from db import database as _database  # type: ignore
     from db import models as _models  # type: ignore
-except Exception as exc:  # pragma: no cover - best-effort import
+except Exception:  # pragma: no cover - best-effort import
     _database = None
     _models = None
 
+try:
+    from app.config import db as _async_db  # type: ignore
+except Exception:  # pragma: no cover - best-effort import
+    _async_db = None
+
 # Application settings
 class Settings(BaseSettings):
     app_name: str = "Sentenial-X Backend"
@@ -39,6 +46,9 @@ class Settings(BaseSettings):
     port: int = 8000
     debug: bool = False
     reload: bool = False
+    # Create missing tables at startup (always on in debug). Production schemas should be
+    # managed by migrations so N workers don't race CREATE TABLE on boot.
+    auto_migrate: bool = False
     # Comma-separated list or '*' for all
     allowed_origins: str = "*"  # e.g. "https://app.example.com,https://admin.example.com"
 
@@ -58,7 +68,12 @@ logging.basicConfig(
 )
 
 # Create FastAPI app
-app = FastAPI(title=settings.app_name, version=settings.version, debug=settings.debug)
+app = FastAPI(
+    title=settings.app_name,
+    version=settings.version,
+    debug=settings.debug,
+    default_response_class=ORJSONResponse,
+)
 
 # CORS setup
 def parse_origins(origins_value: str) -> List[str]:
@@ -78,37 +93,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Utility: safe router include
-def try_include_router(module_path: str, router_attr: str = "router", prefix: Optional[str] = None, tags: Optional[List[str]] = None):
-    """
-    Attempt to import a module and include its router on the app.
-    Logs a clear warning if import fails.
-    """
-    try:
-        module = importlib.import_module(module_path)
-        router = getattr(module, router_attr, None)
-        if router is None or not isinstance(router, APIRouter):
-            logger.warning("Module '%s' does not expose an APIRouter named '%s'. Skipping.", module_path, router_attr)
-            return
-        app.include_router(router, prefix=prefix or "", tags=tags or [])
-        logger.info("Included router from %s (prefix=%s)", module_path, prefix or "")
-    except Exception as exc:
-        logger.warning("Could not include router from %s: %s", module_path, exc)
-
-# Include known routers (best-effort to support different project structures)
-# Common locations in this repo historically: "app.routes.*" or "api.*"
-try_include_router("app.routes.auth", prefix="/auth", tags=["Auth"])
-try_include_router("api.auth", prefix="/auth", tags=["Auth"])
-
-try_include_router("app.routes.payments", prefix="/payments", tags=["Payments"])
-try_include_router("api.payments", prefix="/payments", tags=["Payments"])
-
-try_include_router("app.routes.kyc", prefix="/kyc", tags=["KYC"])
-try_include_router("api.kyc", prefix="/kyc", tags=["KYC"])
+# Routers. The "api.*" routers declare their own prefix, so none is added here
+# (that would nest to e.g. /auth/auth/login). They are included first so the
+# DB-backed endpoints win over the placeholder "app.routes.*" ones on overlapping paths.
+from api import auth as auth_api  # noqa: E402
+from api import payments as payments_api  # noqa: E402
+from api import KYC as kyc_api  # noqa: E402
+from api import dashboard as dashboard_api  # noqa: E402
+from app.routes import auth as auth_routes  # noqa: E402
+from app.routes import payments as payments_routes  # noqa: E402
+from app.routes import kyc as kyc_routes  # noqa: E402
+
+app.include_router(auth_api.router, tags=["Auth"])
+app.include_router(payments_api.router, tags=["Payments"])
+app.include_router(kyc_api.router, tags=["KYC"])
+app.include_router(dashboard_api.router, tags=["Dashboard"])
+
+app.include_router(auth_routes.router, prefix="/auth", tags=["Auth"])
+app.include_router(payments_routes.router, prefix="/payments", tags=["Payments"])
+app.include_router(kyc_routes.router, prefix="/kyc", tags=["KYC"])
+
+# Optional routers whose modules are not implemented in every deployment
+try:
+    from api.threats import router as threats_router  # noqa: E402
+    app.include_router(threats_router, tags=["Threats"])
+except ImportError as exc:
+    logger.warning("Threats router unavailable: %s", exc)
 
-try_include_router("app.routes.ai_routes", prefix="/ai", tags=["AI"])
-try_include_router("api.threats", prefix="/threats", tags=["Threats"])
-try_include_router("api.dashboard", prefix="/dashboard", tags=["Dashboard"])
+try:
+    from app.routes.ai_routes import router as ai_router  # noqa: E402
+    app.include_router(ai_router, prefix="/ai", tags=["AI"])
+except ImportError as exc:
+    logger.warning("AI router unavailable: %s", exc)
 
 # Health and root endpoints
 @app.get("/", tags=["Root"])
@@ -138,19 +154,25 @@ async def health():
 @app.on_event("startup")
 async def on_startup() -> None:
     logger.info("Starting %s...", settings.app_name)
-    # Initialize DB schema if available
-    if _models is not None and _database is not None:
+    # Initialize DB schema if available and enabled
+    if (settings.auto_migrate or settings.debug) and _models is not None and _database is not None:
         try:
             Base = getattr(_models, "Base", None)
             engine = getattr(_database, "engine", None)
             if Base is not None and engine is not None:
-                Base.metadata.create_all(bind=engine)
+                await _database.create_all(Base.metadata)
                 logger.info("Database schema checked/created.")
             else:
                 logger.debug("DB models or engine not found; skipping create_all()")
         except Exception as exc:
             logger.exception("Failed to initialize database schema: %s", exc)
 
+    # Pre-open pooled connections so the first requests don't pay connection setup
+    if _database is not None:
+        try:
+            await _database.warm_pool()
+        except Exception as exc:
+            logger.warning("Could not warm database pool: %s", exc)
     # Warm up AI models if present
     try:
         ai_module = importlib.import_module("app.ai_core.predictive_model")
@@ -177,14 +199,18 @@ async def on_startup() -> None:
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
     logger.info("Shutting down %s...", settings.app_name)
-    # Close DB connections if provided
-    try:
-        close_fn = getattr(_database, "disconnect", None)
-        if callable(close_fn):
-            await close_fn()  # type: ignore
-            logger.info("Database disconnected.")
-    except Exception:
-        logger.debug("No async disconnect available or disconnect failed.")
+    # Close pooled DB connections
+    if _async_db is not None:
+        try:
+            await _async_db.disconnect_db()
+            logger.info("Async database pool closed.")
+        except Exception:
+            logger.debug("Async database pool close failed.")
+    if _database is not None:
+        try:
+            await _database.dispose()
+        except Exception:
+            logger.debug("Database engine dispose failed.")
 
 # Run using "python backend/main.py"
 def main():
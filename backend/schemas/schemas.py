@@ -1 +1,18 @@
+# backend/schemas/schemas.py
+from decimal import Decimal
 
+from pydantic import BaseModel, Field
+
+
+class LoginRequest(BaseModel):
+    username: str = Field(..., min_length=1, max_length=150)
+    password: str = Field(..., min_length=1)
+
+
+class PaymentRequest(BaseModel):
+    amount: Decimal = Field(..., gt=0, max_digits=12, decimal_places=2)
+
+
+class KYCRequest(BaseModel):
+    full_name: str = Field(..., min_length=1, max_length=255)
+    id_number: str = Field(..., min_length=1, max_length=64)
@@ -0,0 +1,20 @@
+# backend/tests/conftest.py
+import os
+import sys
+
+import pytest
+
+# Modules import each other as top-level packages (api, app, db, ...), as under uvicorn
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def pg_url():
+    """
+    URL of a throwaway PostgreSQL database (TEST_DATABASE_URL). Tests using it drop and
+    recreate the application tables, so never point it at a real database.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+    return url
@@ -0,0 +1,48 @@
+# backend/tests/test_auth.py
+import asyncio
+
+import bcrypt
+import jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api import auth
+from app.config.security import ALGORITHM, SECRET_KEY
+from db import models
+from db.database import _async_url
+from schemas.schemas import LoginRequest
+
+
+def test_verify_password_accepts_bcrypt_hashes():
+    legacy = bcrypt.hashpw(b"hunter2", bcrypt.gensalt()).decode()
+    assert auth.verify_password("hunter2", legacy)
+    assert not auth.verify_password("wrong", legacy)
+
+
+def test_bcrypt_user_logs_in_and_is_rehashed_to_argon2(pg_url):
+    async def run():
+        engine = create_async_engine(_async_url(pg_url))
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.drop_all)
+                await conn.run_sync(models.Base.metadata.create_all)
+            legacy = bcrypt.hashpw(b"hunter2", bcrypt.gensalt()).decode()
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                db.add(models.User(username="alice", hashed_password=legacy))
+                await db.commit()
+                resp = await auth.login(LoginRequest(username="alice", password="hunter2"), db)
+            async with async_sessionmaker(engine)() as db:
+                stored = (await db.execute(select(models.User.hashed_password))).scalar_one()
+            return resp, stored
+        finally:
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.drop_all)
+            await engine.dispose()
+
+    resp, stored = asyncio.run(run())
+
+    assert resp["success"] and resp["user"]["username"] == "alice"
+    claims = jwt.decode(resp["access_token"], SECRET_KEY, algorithms=[ALGORITHM])
+    assert claims["username"] == "alice"
+    assert stored.startswith("$argon2id$")
+    assert auth.verify_password("hunter2", stored)
@@ -0,0 +1,48 @@
+# backend/tests/test_dashboard.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api import dashboard
+from db import models
+from db.database import _async_url
+
+
+def test_stats_query_runs_on_postgres(pg_url):
+    async def run():
+        engine = create_async_engine(_async_url(pg_url))
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.drop_all)
+                await conn.run_sync(models.Base.metadata.create_all)
+            now = datetime.now(timezone.utc)
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                db.add_all(
+                    [
+                        models.User(username="active", last_login=now - timedelta(days=1)),
+                        models.User(username="stale", last_login=now - timedelta(days=90)),
+                        models.User(username="never"),
+                    ]
+                    + [
+                        models.Threat(title=f"threat {i}", severity=severity, created_at=now - timedelta(minutes=i))
+                        for i, severity in enumerate(["high", "low", "high", None, "medium", "low", "high"])
+                    ]
+                )
+                await db.commit()
+                return await dashboard._compute_stats(db)
+        finally:
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.drop_all)
+            await engine.dispose()
+
+    stats = asyncio.run(run())
+
+    assert stats["total_threats"] == 7
+    assert stats["total_users"] == 3
+    assert stats["active_users_30d"] == 1
+    assert stats["threats_by_severity"] == {"high": 3, "low": 2, "medium": 1, "None": 1}
+    recent = stats["recent_threats"]
+    assert [t["title"] for t in recent] == [f"threat {i}" for i in range(dashboard.RECENT_THREATS_LIMIT)]
+    assert all(isinstance(t["id"], int) and t["created_at"].tzinfo is not None for t in recent)
+    dashboard.StatsResponse(**stats)
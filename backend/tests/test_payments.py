@@ -0,0 +1,51 @@
+# backend/tests/test_payments.py
+import asyncio
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import orjson
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api import payments
+from db import models
+from db.database import _async_url
+
+
+async def _page(db, **cursor):
+    resp = await payments.get_payment_history(db=db, limit=2, **cursor)
+    body = b"".join([chunk async for chunk in resp.body_iterator])
+    return orjson.loads(body)["payments"]
+
+
+def test_history_pages_through_payments_sharing_paid_at(pg_url):
+    async def run():
+        engine = create_async_engine(_async_url(pg_url))
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.drop_all)
+                await conn.run_sync(models.Base.metadata.create_all)
+            same = datetime(2025, 1, 1, tzinfo=timezone.utc)
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                db.add_all([models.Payment(amount=Decimal("10.00") + i, paid_at=same) for i in range(5)])
+                db.add(models.Payment(amount=Decimal("0.10"), paid_at=datetime(2024, 1, 1, tzinfo=timezone.utc)))
+                await db.commit()
+
+                seen = []
+                page = await _page(db, before=None, before_id=None)
+                while page:
+                    seen.extend(page)
+                    last = page[-1]
+                    page = await _page(db, before=datetime.fromisoformat(last["paid_at"]), before_id=last["id"])
+                return seen
+        finally:
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.drop_all)
+            await engine.dispose()
+
+    seen = asyncio.run(run())
+
+    assert len(seen) == 6
+    assert len({p["id"] for p in seen}) == 6
+    assert seen[-1]["amount"] == "0.10"
+    keys = [(p["paid_at"], p["id"]) for p in seen]
+    assert keys == sorted(keys, reverse=True)
@@ -0,0 +1,29 @@
+# backend/tests/test_risk.py
+import numpy as np
+import pandas as pd
+
+from utils.risk import calculate_risk, calculate_risk_batch
+
+EVENTS = [
+    {"severity": "high", "tags": ["APT29"], "source": "external"},
+    {"severity": "high", "tags": np.array(["phishing", "APT29"]), "source": "internal"},
+    {"severity": "low", "tags": ("APT29",), "source": "unknown"},
+    {"severity": "medium", "tags": {"APT28"}, "source": "external"},
+    {"severity": "high", "tags": None, "source": None},
+    {"severity": "low", "tags": "APT29", "source": "internal"},
+    {"severity": "high", "tags": [], "source": "unknown"},
+    {"source": "external"},
+    {"severity": "high", "tags": ["APT29"], "source": ["external"]},
+    {},
+]
+
+
+def test_batch_matches_scalar():
+    expected = [calculate_risk(event) for event in EVENTS]
+    assert expected == [100, 80, 50, 20, 50, 0, 70, 20, 80, 0]
+    assert calculate_risk_batch(pd.DataFrame(EVENTS)).tolist() == expected
+
+
+def test_batch_without_optional_columns():
+    events = pd.DataFrame({"severity": ["high", "low"]})
+    assert calculate_risk_batch(events).tolist() == [50, 0]
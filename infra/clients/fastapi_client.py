@@ -1,15 +1,58 @@
 # clients/fastapi_client.py
+# Consumers need httpx[http2] and orjson, and must await aclose() on shutdown, e.g.
+# app.add_event_handler("shutdown", fastapi_client.aclose)
 import os
+import importlib.util
 import httpx
-from typing import Dict
+import orjson
+from typing import AsyncIterator, Dict
 
 MODEL_SERVICE_URL = os.getenv("MODEL_SERVICE_URL", "http://model-server:8080")
 
+# One pooled client for the whole process: connections (and HTTP/2 streams) are reused
+# across calls instead of paying a new TCP/TLS handshake per request. Without the h2
+# package (httpx[http2]) httpx refuses http2=True, so fall back to pooled HTTP/1.1.
+_client = httpx.AsyncClient(
+    base_url=MODEL_SERVICE_URL,
+    http2=importlib.util.find_spec("h2") is not None,
+    timeout=120.0,
+    limits=httpx.Limits(max_connections=256, max_keepalive_connections=64),
+)
+
 async def call_model_service(prompt: str, model_endpoint: str = "/infer", **kwargs) -> Dict:
-    url = MODEL_SERVICE_URL + model_endpoint
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        payload = {"prompt": prompt}
-        payload.update(kwargs)
-        resp = await client.post(url, json=payload)
+    payload = {"prompt": prompt}
+    payload.update(kwargs)
+    resp = await _client.post(model_endpoint, json=payload)
+    resp.raise_for_status()
+    return orjson.loads(resp.content)
+
+async def stream_model_service(prompt: str, model_endpoint: str = "/infer/stream", **kwargs) -> AsyncIterator[str]:
+    """
+    Yield completion text deltas from the model service's SSE endpoint as they are generated.
+    Raises RuntimeError if the service reports an error, or if the stream ends without
+    its [DONE] marker.
+    """
+    payload = {"prompt": prompt}
+    payload.update(kwargs)
+    async with _client.stream("POST", model_endpoint, json=payload) as resp:
         resp.raise_for_status()
-        return resp.json()
+        event = "message"
+        async for line in resp.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                continue
+            if not line.startswith("data: "):
+                if not line:
+                    event = "message"
+                continue
+            data = line[len("data: "):]
+            if event == "error":
+                raise RuntimeError(f"Model service error: {orjson.loads(data)['error']}")
+            if data == "[DONE]":
+                return
+            yield orjson.loads(data)["token"]
+    raise RuntimeError("Model service stream ended before completion")
+
+async def aclose() -> None:
+    """Close pooled connections; call from the application's shutdown hook."""
+    await _client.aclose()
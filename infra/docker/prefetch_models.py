@@ -1,9 +1,28 @@
 # infra/docker/prefetch_models.py
+import importlib.util
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+# Rust multi-connection downloader; only enabled when installed (huggingface_hub errors otherwise)
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+else:
+    os.environ.pop("HF_HUB_ENABLE_HF_TRANSFER", None)
+
 from huggingface_hub import snapshot_download
 
 # Destination
 cache_dir = os.getenv("HF_HOME", "/opt/models")
+# Parallel file downloads within each repo
+per_repo_workers = int(os.getenv("PREFETCH_WORKERS_PER_REPO", "16"))
+# Comma-separated repos whose snapshot also gets its weights as one packed.pt, which the
+# model server mmaps instead of rebuilding the model from HF shards on every start. Only
+# list models served from a single GPU (the only case the server's packed path handles);
+# packing loads the full model into CPU RAM, so repos are packed one at a time.
+pack_models = [m.strip() for m in os.getenv("PACK_MODELS", "").split(",") if m.strip()]
+PACKED_CHECKPOINT = "packed.pt"
 
 # Models to prefetch (update as needed)
 models = [
@@ -15,8 +34,69 @@ models = [
     # add WormGPT detector weights if hosted on HF
 ]
 
-for model in models:
+# Written once a repo has fully downloaded. cache_dir should be a persistent volume
+# (e.g. -v hfcache:/opt/models) so later runs skip finished repos without any Hub calls.
+COMPLETE_MARKER = ".prefetch-complete"
+
+def repo_cache_dir(model):
+    return Path(cache_dir) / f"models--{model.replace('/', '--')}"
+
+def pack(path):
+    packed = Path(path) / PACKED_CHECKPOINT
+    if packed.exists():
+        return
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    print(f"📦 Packing {path} -> {packed}")
+    model = AutoModelForCausalLM.from_pretrained(
+        path, torch_dtype=torch.bfloat16, low_cpu_mem_usage=True, use_safetensors=True
+    )
+    tmp = packed.with_suffix(".tmp")
+    torch.save(model.state_dict(), tmp)
+    os.replace(tmp, packed)  # never leave a truncated packed.pt behind
+
+def fetch(model):
+    marker = repo_cache_dir(model) / COMPLETE_MARKER
+    if marker.exists():
+        print(f"⏭️  {model} already cached")
+        return marker.read_text()
     print(f"📥 Downloading {model} into {cache_dir}")
-    snapshot_download(repo_id=model, cache_dir=cache_dir, ignore_patterns=["*.pt", "*.bin"])  # filter if needed
+    path = snapshot_download(
+        repo_id=model,
+        cache_dir=cache_dir,
+        max_workers=per_repo_workers,
+        ignore_patterns=["*.pt", "*.bin"],  # filter if needed
+        token=os.environ.get("HF_TOKEN"),
+    )
+    marker.write_text(path)
+    return path
+
+# All repos download concurrently, so wall time is the slowest repo rather than the sum
+failed = []
+paths = {}
+with ThreadPoolExecutor(max_workers=len(models)) as pool:
+    futures = {pool.submit(fetch, model): model for model in models}
+    for fut in as_completed(futures):
+        model = futures[fut]
+        try:
+            paths[model] = fut.result()
+            print(f"✅ {model} ready at {paths[model]}")
+        except Exception as exc:
+            failed.append(model)
+            print(f"❌ Failed to download {model}: {exc}")
+
+# Sequential, after every download has finished: each pack holds a whole model in RAM
+for model in pack_models:
+    if model not in paths:
+        print(f"⚠️  Not packing {model}: not downloaded")
+        continue
+    try:
+        pack(paths[model])
+    except Exception as exc:
+        failed.append(model)
+        print(f"❌ Failed to pack {model}: {exc}")
 
+if failed:
+    sys.exit(f"Model prefetch incomplete; failed: {', '.join(failed)}")
 print("✅ Model prefetch complete. Cache ready at", cache_dir)
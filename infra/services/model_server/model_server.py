@@ -1,15 +1,38 @@
 # services/model_server/model_server.py
 import os
 import asyncio
-from typing import Dict
+from array import array
+import orjson
+import hashlib
+import importlib.util
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, fields
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from cachetools import LRUCache
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 import uvicorn
 import logging
 
+import torch
+import torch.nn.functional as F
 # Replace these libraries with your real serving stack (deepspeed-inference, transformers, accelerate)
 from transformers import AutoTokenizer, AutoModelForCausalLM  # placeholder
 
+try:
+    from transformers import DynamicCache
+except ImportError:  # older transformers take the legacy tuple cache directly
+    DynamicCache = None
+
+try:
+    from vllm import AsyncEngineArgs, AsyncLLMEngine, SamplingParams
+except ImportError:  # vLLM is optional; the transformers backend is used without it
+    AsyncLLMEngine = None
+
 logger = logging.getLogger("model_server")
 logging.basicConfig(level=logging.INFO)
 
@@ -17,10 +40,60 @@ MODEL_DIR = os.getenv("MODEL_DIR", "/models")
 MODEL_NAME = os.getenv("MODEL_NAME", "your-model-folder")  # e.g., /models/405b-shard
 PORT = int(os.getenv("PORT", "8080"))
 
+# "vllm" (continuous batching + PagedAttention + tensor parallel), "hf" (transformers,
+# batched by ContinuousBatcher below) or "auto" (vllm when installed).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "auto").lower()
+TENSOR_PARALLEL_SIZE = int(os.getenv("TENSOR_PARALLEL_SIZE", str(max(1, torch.cuda.device_count()))))
+# Compute is always bf16. Weights can additionally be stored as "int8" (bitsandbytes,
+# transformers backend) or "fp8" (vLLM; Hopper/Ada tensor cores, also quantizes the KV cache).
+QUANTIZATION = os.getenv("QUANTIZATION", "none").lower()
+KV_CACHE_DTYPE = os.getenv("KV_CACHE_DTYPE", "fp8_e5m2" if QUANTIZATION == "fp8" else "auto")
+
+# How the transformers backend places weights that are not in packed.pt:
+#   "dispatch"  - empty model + accelerate load_checkpoint_and_dispatch: each shard is read
+#                 straight onto the GPU that owns its layers, decoder layers never split
+#   "auto"      - from_pretrained(device_map="auto"); also used for QUANTIZATION=int8
+# Both run in this one process and split layers across GPUs (pipeline-style). For tensor
+# parallel 70B/405B serving use INFERENCE_BACKEND=vllm with TENSOR_PARALLEL_SIZE.
+LOAD_STRATEGY = os.getenv("LOAD_STRATEGY", "dispatch").lower()
+
+# Speculative decoding: a small draft model from the same family (same tokenizer), e.g.
+# an 8B folder under MODEL_DIR for a 70B target, proposes NUM_SPECULATIVE_TOKENS tokens
+# that one target forward verifies. vLLM applies it to every sequence; the transformers
+# backend uses it (assisted generation) only for a request that arrives while idle.
+DRAFT_MODEL_NAME = os.getenv("DRAFT_MODEL_NAME", "")
+NUM_SPECULATIVE_TOKENS = int(os.getenv("NUM_SPECULATIVE_TOKENS", "5"))
+
+# Continuous batching: at most MAX_BATCH_SIZE sequences decode together. When idle, the
+# first batch is admitted once MAX_BATCH_SIZE requests are queued or BATCH_TIMEOUT_MS
+# after the first one arrived, whichever comes first.
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
+# vLLM schedules its own batches; its running-sequence cap is separate and defaults to vLLM's
+VLLM_MAX_NUM_SEQS = os.getenv("VLLM_MAX_NUM_SEQS")
+BATCH_TIMEOUT_MS = float(os.getenv("BATCH_TIMEOUT_MS", "10"))
+# Length bucketing: prompts in one prefill forward differ in length by at most
+# MAX_BUCKET_LENGTH_RATIO, and a forward pads to at most MAX_BATCH_TOKENS prompt tokens.
+# With vLLM, MAX_BATCH_TOKENS is its max_num_batched_tokens instead.
+MAX_BATCH_TOKENS = int(os.getenv("MAX_BATCH_TOKENS", "8192"))
+MAX_BUCKET_LENGTH_RATIO = float(os.getenv("MAX_BUCKET_LENGTH_RATIO", "1.5"))
+# Prompts are truncated to their last MAX_CTX tokens
+MAX_CTX = int(os.getenv("MAX_CTX", "8192"))
+# Written by infra/docker/prefetch_models.py (PACK_MODELS=1): the full bf16 state_dict
+# in one file, loaded with mmap instead of re-reading the HF shard index on every start
+PACKED_CHECKPOINT = "packed.pt"
+# Greedy (temperature=0) completions are deterministic, so repeats are answered from this cache
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+# Prompt-prefix KV reuse (shared system preambles are prefilled once). vLLM uses its
+# automatic prefix caching; the transformers backend keeps up to PREFIX_CACHE_BLOCKS
+# blocks of PREFIX_BLOCK_SIZE tokens (0 disables). Each block costs
+# 2 * layers * kv_heads * head_dim * PREFIX_BLOCK_SIZE * 2 bytes of GPU memory.
+PREFIX_BLOCK_SIZE = int(os.getenv("PREFIX_BLOCK_SIZE", "64"))
+PREFIX_CACHE_BLOCKS = int(os.getenv("PREFIX_CACHE_BLOCKS", "128"))
+
 # ---- Request/Response schemas ----
 class InferRequest(BaseModel):
-    prompt: str
-    max_tokens: int = 512
+    prompt: str = Field(..., min_length=1)
+    max_tokens: int = Field(512, ge=1)
     temperature: float = 0.0
 
 class InferResponse(BaseModel):
@@ -31,34 +104,579 @@ class InferResponse(BaseModel):
 # ---- Lazy model load ----
 tokenizer = None
 model = None
+draft_model = None
+engine = None  # vLLM AsyncLLMEngine when that backend is active
+eos_token_ids: Set[int] = set()
+
+def use_vllm() -> bool:
+    if INFERENCE_BACKEND == "hf":
+        return False
+    if AsyncLLMEngine is None:
+        if INFERENCE_BACKEND == "vllm":
+            raise RuntimeError("INFERENCE_BACKEND=vllm but vllm is not installed")
+        return False
+    return True
+
+def load_vllm_engine(model_path: str):
+    global engine
+    speculative = {}
+    if DRAFT_MODEL_NAME:
+        draft_path = os.path.join(MODEL_DIR, DRAFT_MODEL_NAME)
+        if "speculative_config" in {f.name for f in fields(AsyncEngineArgs)}:
+            speculative = dict(
+                speculative_config={"model": draft_path, "num_speculative_tokens": NUM_SPECULATIVE_TOKENS}
+            )
+        else:  # vLLM releases before speculative_config
+            speculative = dict(speculative_model=draft_path, num_speculative_tokens=NUM_SPECULATIVE_TOKENS)
+    limits = dict(max_num_seqs=int(VLLM_MAX_NUM_SEQS)) if VLLM_MAX_NUM_SEQS else {}
+    engine = AsyncLLMEngine.from_engine_args(AsyncEngineArgs(
+        model=model_path,
+        tensor_parallel_size=TENSOR_PARALLEL_SIZE,
+        max_num_batched_tokens=MAX_BATCH_TOKENS,
+        enable_chunked_prefill=True,  # lets max_num_batched_tokens be below the context length
+        enable_prefix_caching=True,
+        dtype="bfloat16",
+        quantization="fp8" if QUANTIZATION == "fp8" else None,
+        kv_cache_dtype=KV_CACHE_DTYPE,
+        trust_remote_code=True,
+        **speculative,
+        **limits,
+    ))
+
+def hf_quantization_config():
+    if QUANTIZATION == "int8":
+        from transformers import BitsAndBytesConfig
+        return BitsAndBytesConfig(load_in_8bit=True)
+    if QUANTIZATION == "fp8":
+        logger.warning("QUANTIZATION=fp8 needs the vLLM backend; loading bf16 weights instead")
+    return None
+
+def load_packed(model_path: str):
+    """
+    Build the model from config on the meta device and attach the weights of
+    packed.pt in place (mmap'd, so pages go straight from disk to the device copy).
+    Returns None when the packed fast path does not apply.
+    """
+    packed = os.path.join(model_path, PACKED_CHECKPOINT)
+    if not os.path.exists(packed):
+        return None
+    if QUANTIZATION != "none" or torch.cuda.device_count() > 1:
+        # int8 and multi-GPU placement go through from_pretrained
+        return None
+    try:
+        from accelerate import init_empty_weights
+    except ImportError:
+        return None
+    from transformers import AutoConfig
+
+    config = AutoConfig.from_pretrained(model_path, trust_remote_code=True)
+    with init_empty_weights():  # parameters only; non-persistent buffers stay materialised
+        packed_model = AutoModelForCausalLM.from_config(config, torch_dtype=torch.bfloat16, trust_remote_code=True)
+    state = torch.load(packed, map_location="cpu", mmap=True, weights_only=True)
+    packed_model.load_state_dict(state, assign=True)
+    packed_model.tie_weights()
+    return packed_model.to("cuda" if torch.cuda.is_available() else "cpu")
+
+def load_dispatched(model_path: str):
+    from accelerate import init_empty_weights, load_checkpoint_and_dispatch
+    from transformers import AutoConfig
+
+    config = AutoConfig.from_pretrained(model_path, trust_remote_code=True)
+    with init_empty_weights():
+        empty = AutoModelForCausalLM.from_config(config, torch_dtype=torch.bfloat16, trust_remote_code=True)
+    empty.tie_weights()
+    return load_checkpoint_and_dispatch(
+        empty,
+        model_path,
+        device_map="auto",
+        dtype=torch.bfloat16,
+        no_split_module_classes=empty._no_split_modules or [],
+    )
 
 def load_model():
-    global tokenizer, model
-    if model is not None:
+    global tokenizer, model, draft_model, eos_token_ids
+    if model is not None or engine is not None:
         return
     model_path = os.path.join(MODEL_DIR, MODEL_NAME)
     logger.info(f"Loading model from: {model_path}")
-    # ---- Replace this with DeepSpeed / HF accelerate initialization for 70B/405B ----
-    tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
-    model = AutoModelForCausalLM.from_pretrained(
-        model_path,
-        # low_cpu_mem_usage=True,
-        torch_dtype="auto",
-        device_map="auto",  # only works for fitted GPUs; for big models use accelerate/deepspeed
-    )
+    if use_vllm():
+        load_vllm_engine(model_path)
+        logger.info("Model loaded (vLLM, tensor_parallel_size=%d)", TENSOR_PARALLEL_SIZE)
+        return
+    tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True, trust_remote_code=True)
+    # Batched generation with a decoder-only model needs left padding and a pad token;
+    # over-long prompts keep their end, which is what the completion continues from
+    tokenizer.padding_side = "left"
+    tokenizer.truncation_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = load_packed(model_path)
+    if model is not None:
+        logger.info("Loaded weights from %s", PACKED_CHECKPOINT)
+    elif LOAD_STRATEGY == "dispatch" and QUANTIZATION == "none" and importlib.util.find_spec("accelerate"):
+        model = load_dispatched(model_path)
+        logger.info("Loaded weights with accelerate dispatch across %d GPU(s)", torch.cuda.device_count())
+    else:
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            # mmap safetensors shards and fill parameters in place instead of building a
+            # randomly initialised copy in CPU RAM first (prefetch only fetches *.safetensors)
+            low_cpu_mem_usage=True,
+            use_safetensors=True,
+            torch_dtype=torch.bfloat16,
+            quantization_config=hf_quantization_config(),
+            device_map="auto",
+        )
     model.eval()
+    if DRAFT_MODEL_NAME:
+        draft_model = AutoModelForCausalLM.from_pretrained(
+            os.path.join(MODEL_DIR, DRAFT_MODEL_NAME),
+            low_cpu_mem_usage=True,
+            use_safetensors=True,
+            torch_dtype=torch.bfloat16,
+            device_map="auto",
+        )
+        draft_model.eval()
+        logger.info("Draft model %s loaded for assisted generation", DRAFT_MODEL_NAME)
+    eos = model.generation_config.eos_token_id
+    if eos is None:
+        eos = tokenizer.eos_token_id
+    eos_token_ids = set(eos) if isinstance(eos, (list, tuple)) else {eos}
     logger.info("Model loaded")
 
 # ---- Inference wrapper ----
-def run_inference_sync(prompt: str, max_tokens: int = 512, temperature: float = 0.0) -> str:
-    # Very small wrapper for tokenizer + generate. Replace with your performant pipeline.
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    out = model.generate(**inputs, max_new_tokens=max_tokens, do_sample=(temperature>0), temperature=temperature)
-    text = tokenizer.decode(out[0], skip_special_tokens=True)
-    return text
+def bucket_by_length(lengths: List[int]) -> List[List[int]]:
+    """
+    Group item indices so each bucket wastes little compute on padding.
+    Items are sorted by length and a bucket is closed once adding the next one would
+    exceed MAX_BUCKET_LENGTH_RATIO (longest/shortest) or MAX_BATCH_TOKENS padded tokens.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    buckets: List[List[int]] = []
+    current: List[int] = []
+    for i in order:
+        if current:
+            shortest = max(1, lengths[current[0]])
+            longest = lengths[i]
+            if longest > MAX_BUCKET_LENGTH_RATIO * shortest or longest * (len(current) + 1) > MAX_BATCH_TOKENS:
+                buckets.append(current)
+                current = []
+        current.append(i)
+    if current:
+        buckets.append(current)
+    return buckets
+
+# ---- Continuous batching ----
+@dataclass
+class Sequence:
+    req: InferRequest
+    future: asyncio.Future
+    prompt_ids: List[int]
+    generated: List[int] = field(default_factory=list)
+    stream: Optional[asyncio.Queue] = None  # receives text deltas, then None (/infer/stream)
+    streamed: int = 0                       # characters of completion text already sent
+
+    def text_delta(self) -> str:
+        text = tokenizer.decode(self.generated, skip_special_tokens=True)
+        if text.endswith("\ufffd"):  # token ends mid-character; wait for the rest
+            return ""
+        delta = text[self.streamed:]
+        self.streamed = len(text)
+        return delta
+
+# (request, result future, stream queue or None) as queued for the inference thread
+Pending = Tuple[InferRequest, asyncio.Future, Optional[asyncio.Queue]]
+
+def _legacy_cache(past):
+    # Normalise model outputs to the tuple-of-(key, value) layout: [batch, heads, seq, head_dim]
+    return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+def _model_cache(legacy):
+    return DynamicCache.from_legacy_cache(legacy) if DynamicCache is not None else legacy
+
+def _left_pad(t: "torch.Tensor", length: int, dim: int) -> "torch.Tensor":
+    missing = length - t.shape[dim]
+    if missing == 0:
+        return t
+    pad = [0, 0] * (t.dim() - 1 - (dim % t.dim())) + [missing, 0]
+    return F.pad(t, pad)
+
+def _sample(logits: "torch.Tensor", temperatures: List[float]) -> "torch.Tensor":
+    greedy = logits.argmax(dim=-1)
+    temps = torch.tensor(temperatures, device=logits.device, dtype=torch.float32)
+    if not bool((temps > 0).any()):
+        return greedy
+    probs = torch.softmax(logits.float() / temps.clamp(min=1e-5)[:, None], dim=-1)
+    sampled = torch.multinomial(probs, 1).squeeze(-1)
+    return torch.where(temps > 0, sampled, greedy)
+
+class PrefixCache:
+    """
+    KV for prompt prefixes, stored per PREFIX_BLOCK_SIZE-token block. A block is keyed by
+    (blake2b digest of every token before it, block tokens), so a lookup walks the prompt
+    like a trie and a hit means the whole prefix matched, not just this block. A digest
+    collision would serve one user's KV to another, hence a cryptographic hash rather
+    than hash(). Blocks are evicted LRU; a matched chain is touched tail-first so it is
+    evicted from the tail.
+    Only used from the inference thread.
+    """
+
+    def __init__(self, max_blocks: int):
+        self.blocks: LRUCache = LRUCache(maxsize=max_blocks)
+
+    @staticmethod
+    def _keys(ids: List[int], n_blocks: int):
+        parent = b""
+        for b in range(n_blocks):
+            block = ids[b * PREFIX_BLOCK_SIZE:(b + 1) * PREFIX_BLOCK_SIZE]
+            yield parent, tuple(block)
+            parent = hashlib.blake2b(parent + array("q", block).tobytes(), digest_size=32).digest()
+
+    def _touch(self, keys):
+        for key in reversed(keys):
+            self.blocks.get(key)  # LRUCache lookups refresh recency
+
+    def match(self, ids: List[int]):
+        """Return (cached token count, legacy KV for them); at least one token is left to forward."""
+        hits = []
+        for key in self._keys(ids, (len(ids) - 1) // PREFIX_BLOCK_SIZE):
+            kv = self.blocks.get(key)
+            if kv is None:
+                break
+            hits.append((key, kv))
+        if not hits:
+            return 0, None
+        self._touch([key for key, _ in hits])
+        past = tuple(
+            (
+                torch.cat([kv[layer][0] for _, kv in hits], dim=-2),
+                torch.cat([kv[layer][1] for _, kv in hits], dim=-2),
+            )
+            for layer in range(len(hits[0][1]))
+        )
+        return len(hits) * PREFIX_BLOCK_SIZE, past
+
+    def insert(self, ids: List[int], past, row: int, start: int):
+        """Store the full blocks of `ids`, whose KV is batch row `row` of `past` from column `start`."""
+        keys = list(self._keys(ids, len(ids) // PREFIX_BLOCK_SIZE))
+        for b, key in enumerate(keys):
+            if key in self.blocks:
+                continue
+            lo = start + b * PREFIX_BLOCK_SIZE
+            hi = lo + PREFIX_BLOCK_SIZE
+            # clone: a slice would keep the whole batch's KV tensor alive
+            self.blocks[key] = tuple(
+                (k[row:row + 1, :, lo:hi].clone(), v[row:row + 1, :, lo:hi].clone()) for k, v in past
+            )
+        self._touch(keys)
+
+prefix_cache: Optional[PrefixCache] = PrefixCache(PREFIX_CACHE_BLOCKS) if PREFIX_CACHE_BLOCKS > 0 else None
+
+class ContinuousBatcher:
+    """
+    Iteration-level batching: in-flight sequences share one left-padded KV cache and
+    advance one token per step. Finished sequences leave after the step that finished
+    them, and queued requests are prefilled into the freed slots between steps, so short
+    requests are never held back by long ones.
+    """
+
+    def __init__(self):
+        self.seqs: List[Sequence] = []
+        self.past = None            # legacy KV cache, one (key, value) per layer
+        self.attention_mask = None  # [batch, seq]; 0 marks left padding
+        self.next_tokens = None     # [batch]; last sampled token of each sequence
+        self._pinned = None         # page-locked staging buffer for prompt tensors
+
+    def free_slots(self) -> int:
+        return MAX_BATCH_SIZE - len(self.seqs)
+
+    def reset(self):
+        self.seqs, self.past, self.attention_mask, self.next_tokens = [], None, None, None
+
+    @torch.inference_mode()
+    def admit(self, pending: List[Pending]) -> Tuple[List[Tuple[Sequence, str]], List[Tuple[Sequence, Exception]]]:
+        """
+        Prefill new requests (one forward per length bucket) and merge them into the batch.
+        Returns (finished, failed). A bucket whose forward raises is retried one sequence
+        at a time, so only the requests that fail on their own are failed.
+        """
+        # One fast-tokenizer call for everything admitted; padding happens per bucket
+        prompt_ids = tokenizer(
+            [req.prompt for req, _, _ in pending], padding=False, truncation=True, max_length=MAX_CTX
+        )["input_ids"]
+        seqs = [Sequence(req, fut, ids, stream=stream) for (req, fut, stream), ids in zip(pending, prompt_ids)]
+        failed: List[Tuple[Sequence, Exception]] = [
+            (seq, ValueError("Prompt is empty after tokenization")) for seq in seqs if not seq.prompt_ids
+        ]
+        seqs = [seq for seq in seqs if seq.prompt_ids]
+        for bucket in bucket_by_length([len(seq.prompt_ids) for seq in seqs]):
+            group = [seqs[i] for i in bucket]
+            try:
+                self._prefill(group)
+            except Exception as exc:
+                if len(group) == 1:
+                    logger.exception("Prefill failed")
+                    failed.append((group[0], exc))
+                    continue
+                logger.exception("Prefill of %d sequences failed; retrying them one at a time", len(group))
+                merged = set(map(id, self.seqs))  # cache hits may have merged before the forward failed
+                for seq in group:
+                    if id(seq) in merged:
+                        continue
+                    try:
+                        self._prefill([seq])
+                    except Exception as exc:
+                        logger.exception("Prefill failed")
+                        failed.append((seq, exc))
+        return self._pop_finished(), failed
+
+    @torch.inference_mode()
+    def step(self) -> List[Tuple[Sequence, str]]:
+        """Decode one token for every in-flight sequence."""
+        mask = torch.cat([self.attention_mask, self.attention_mask.new_ones((len(self.seqs), 1))], dim=1)
+        out = model(
+            input_ids=self.next_tokens[:, None],
+            attention_mask=mask,
+            position_ids=mask.sum(dim=-1, keepdim=True) - 1,
+            past_key_values=_model_cache(self.past),
+            use_cache=True,
+        )
+        tokens = _sample(out.logits[:, -1, :], [s.req.temperature for s in self.seqs])
+        self.past = _legacy_cache(out.past_key_values)
+        self.attention_mask = mask
+        self.next_tokens = tokens
+        for seq, token in zip(self.seqs, tokens.tolist()):
+            seq.generated.append(token)
+        return self._pop_finished()
+
+    def _host_buffer(self, shape: Tuple[int, ...]) -> Optional["torch.Tensor"]:
+        """
+        Contiguous view of the pinned staging buffer, so the host-to-device copy can be
+        asynchronous. Reusing it is safe: _prefill syncs on the sampled tokens before the
+        next bucket writes into it. None on CPU or for inputs larger than a bucket can be.
+        """
+        numel = 1
+        for dim in shape:
+            numel *= dim
+        capacity = 2 * max(MAX_BATCH_TOKENS, MAX_CTX)
+        if not torch.cuda.is_available() or numel > capacity:
+            return None
+        if self._pinned is None:
+            self._pinned = torch.empty(capacity, dtype=torch.long, pin_memory=True)
+        return self._pinned[:numel].view(shape)
+
+    def _prefill(self, group: List[Sequence]):
+        if prefix_cache is not None:
+            misses = []
+            for seq in group:
+                cached, past = prefix_cache.match(seq.prompt_ids)
+                if cached:
+                    self._prefill_cached(seq, cached, past)
+                else:
+                    misses.append(seq)
+            group = misses
+            if not group:
+                return
+        enc = tokenizer.pad({"input_ids": [s.prompt_ids for s in group]}, return_tensors="pt")
+        host = self._host_buffer((2,) + tuple(enc["input_ids"].shape))
+        if host is not None:
+            host[0].copy_(enc["input_ids"])
+            host[1].copy_(enc["attention_mask"])
+            input_ids, mask = host.to(model.device, non_blocking=True).unbind(0)
+        else:
+            input_ids = enc["input_ids"].to(model.device)
+            mask = enc["attention_mask"].to(model.device)
+        out = model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=(mask.cumsum(dim=-1) - 1).clamp(min=0),
+            use_cache=True,
+        )
+        tokens = _sample(out.logits[:, -1, :], [s.req.temperature for s in group])
+        past = _legacy_cache(out.past_key_values)
+        if prefix_cache is not None:
+            width = mask.shape[1]
+            for row, seq in enumerate(group):
+                prefix_cache.insert(seq.prompt_ids, past, row, width - len(seq.prompt_ids))
+        self._merge(group, past, mask, tokens)
+        for seq, token in zip(group, tokens.tolist()):
+            seq.generated.append(token)
+
+    def _prefill_cached(self, seq: Sequence, cached: int, prefix_past):
+        """Prefill one sequence whose first `cached` prompt tokens already have KV."""
+        length = len(seq.prompt_ids)
+        mask = torch.ones((1, length), dtype=torch.long, device=model.device)
+        out = model(
+            input_ids=torch.tensor([seq.prompt_ids[cached:]], device=model.device),
+            attention_mask=mask,
+            position_ids=torch.arange(cached, length, device=model.device)[None],
+            past_key_values=_model_cache(prefix_past),
+            use_cache=True,
+        )
+        tokens = _sample(out.logits[:, -1, :], [seq.req.temperature])
+        past = _legacy_cache(out.past_key_values)
+        prefix_cache.insert(seq.prompt_ids, past, 0, 0)
+        self._merge([seq], past, mask, tokens)
+        seq.generated.append(int(tokens[0]))
+
+    def _merge(self, group: List[Sequence], past, mask: "torch.Tensor", tokens: "torch.Tensor"):
+        if self.seqs:
+            # Build everything before assigning, so a failed cat leaves the batch intact
+            length = max(self.attention_mask.shape[1], mask.shape[1])
+            past = tuple(
+                (
+                    torch.cat([_left_pad(k0, length, -2), _left_pad(k1, length, -2)]),
+                    torch.cat([_left_pad(v0, length, -2), _left_pad(v1, length, -2)]),
+                )
+                for (k0, v0), (k1, v1) in zip(self.past, past)
+            )
+            mask = torch.cat([_left_pad(self.attention_mask, length, -1), _left_pad(mask, length, -1)])
+            tokens = torch.cat([self.next_tokens, tokens])
+        self.past, self.attention_mask, self.next_tokens = past, mask, tokens
+        self.seqs.extend(group)
+
+    def _pop_finished(self) -> List[Tuple[Sequence, str]]:
+        keep: List[int] = []
+        done: List[Tuple[Sequence, str]] = []
+        for i, seq in enumerate(self.seqs):
+            if seq.future.done():  # client went away
+                done.append((seq, ""))
+            elif seq.generated[-1] in eos_token_ids or len(seq.generated) >= seq.req.max_tokens:
+                done.append((seq, tokenizer.decode(seq.prompt_ids + seq.generated, skip_special_tokens=True)))
+            else:
+                keep.append(i)
+        if not done:
+            return done
+        if not keep:
+            self.reset()
+            return done
+        idx = torch.tensor(keep, device=self.next_tokens.device)
+        mask = self.attention_mask.index_select(0, idx)
+        # Drop leading columns that are padding for every remaining sequence
+        first = int(mask.any(dim=0).int().argmax())
+        self.attention_mask = mask[:, first:]
+        self.past = tuple(
+            (k.index_select(0, idx.to(k.device))[:, :, first:], v.index_select(0, idx.to(v.device))[:, :, first:])
+            for k, v in self.past
+        )
+        self.next_tokens = self.next_tokens.index_select(0, idx)
+        self.seqs = [self.seqs[i] for i in keep]
+        return done
+
+# ---- Speculative decoding ----
+@torch.inference_mode()
+def assisted_generate(req: InferRequest) -> Tuple[str, int]:
+    """Generate one request with the draft model proposing tokens (HF assisted generation)."""
+    enc = tokenizer(req.prompt, return_tensors="pt", truncation=True, max_length=MAX_CTX).to(model.device)
+    sampling = dict(do_sample=True, temperature=req.temperature) if req.temperature > 0 else dict(do_sample=False)
+    out = model.generate(
+        **enc,
+        assistant_model=draft_model,
+        max_new_tokens=req.max_tokens,
+        pad_token_id=tokenizer.pad_token_id,
+        **sampling,
+    )
+    return tokenizer.decode(out[0], skip_special_tokens=True), out.shape[1] - enc["input_ids"].shape[1]
+
+# ---- Inference thread ----
+# One long-lived thread owns the model/CUDA context and runs every prefill and decode
+# step; the event loop only enqueues requests and awaits their futures (and, for
+# /infer/stream, reads text deltas from the request's stream queue).
+request_queue: "queue.Queue[Pending]" = queue.Queue()
+_inference_thread: Optional[threading.Thread] = None
+batcher = ContinuousBatcher()
+
+def _collect_batch() -> List[Pending]:
+    batch = [request_queue.get()]
+    deadline = time.monotonic() + BATCH_TIMEOUT_MS / 1000.0
+    while len(batch) < MAX_BATCH_SIZE:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(request_queue.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return batch
+
+def _set_result(fut: asyncio.Future, result: Tuple[str, int]):
+    if not fut.done():
+        fut.set_result(result)
+
+def _set_exception(fut: asyncio.Future, exc: BaseException):
+    if not fut.done():
+        fut.set_exception(exc)
+
+def inference_worker(loop: asyncio.AbstractEventLoop):
+    def publish(seqs: List[Sequence]):
+        for seq in seqs:
+            if seq.stream is not None:
+                delta = seq.text_delta()
+                if delta:
+                    loop.call_soon_threadsafe(seq.stream.put_nowait, delta)
+
+    def resolve(finished: List[Tuple[Sequence, str]]):
+        # Futures belong to the event loop; hand (text, generated token count) back to it.
+        # Callbacks run in order, so a stream sees all its deltas before the None sentinel.
+        publish(batcher.seqs + [seq for seq, _ in finished])
+        for seq, text in finished:
+            loop.call_soon_threadsafe(_set_result, seq.future, (text, len(seq.generated)))
+            if seq.stream is not None:
+                loop.call_soon_threadsafe(seq.stream.put_nowait, None)
+
+    def fail(failed: List[Tuple[asyncio.Future, Optional[asyncio.Queue]]], exc: BaseException):
+        for fut, stream in failed:
+            loop.call_soon_threadsafe(_set_exception, fut, exc)
+            if stream is not None:
+                loop.call_soon_threadsafe(stream.put_nowait, None)
+
+    while True:
+        if batcher.seqs:
+            # Admit whatever is already queued into the free slots, without waiting
+            pending = []
+            while len(pending) < batcher.free_slots():
+                try:
+                    pending.append(request_queue.get_nowait())
+                except queue.Empty:
+                    break
+        else:
+            pending = _collect_batch()
+        pending = [p for p in pending if not p[1].done()]
+        if (
+            draft_model is not None and len(pending) == 1 and pending[0][2] is None
+            and not batcher.seqs and request_queue.empty()
+        ):
+            # Nothing to batch with: speculative decoding cuts this request's latency.
+            # Requests arriving meanwhile wait for it, then batch as usual.
+            req, fut, _ = pending[0]
+            try:
+                loop.call_soon_threadsafe(_set_result, fut, assisted_generate(req))
+            except Exception as exc:
+                logger.exception("Assisted generation failed")
+                fail([(fut, None)], exc)
+            continue
+        if pending:
+            try:
+                finished, failed = batcher.admit(pending)
+            except Exception as exc:  # e.g. tokenization; sequences already in flight are unaffected
+                logger.exception("Admitting requests failed")
+                # Anything admitted before the error is dropped by the next step (future done)
+                fail([(fut, stream) for _, fut, stream in pending], exc)
+            else:
+                resolve(finished)
+                for seq, exc in failed:
+                    fail([(seq.future, seq.stream)], exc)
+        if batcher.seqs:
+            try:
+                resolve(batcher.step())
+            except Exception as exc:
+                # One forward decodes every sequence, so all of them lose their KV together
+                logger.exception("Decode step failed")
+                fail([(s.future, s.stream) for s in batcher.seqs], exc)
+                batcher.reset()
 
 # ---- FastAPI app ----
-app = FastAPI(title="Model Server")
+app = FastAPI(title="Model Server", default_response_class=ORJSONResponse)
 
 @app.get("/health")
 async def health():
@@ -66,17 +684,101 @@ async def health():
 
 @app.on_event("startup")
 async def startup_event():
+    global _inference_thread
     # Load model asynchronously at startup
     loop = asyncio.get_event_loop()
     await loop.run_in_executor(None, load_model)
+    if engine is None:
+        _inference_thread = threading.Thread(target=inference_worker, args=(loop,), name="inference", daemon=True)
+        _inference_thread.start()
+
+async def vllm_generate(req: InferRequest) -> Tuple[str, int]:
+    # vLLM is async-native and batches internally; no executor or local queue involved
+    params = SamplingParams(max_tokens=req.max_tokens, temperature=req.temperature)
+    final = None
+    async for out in engine.generate(req.prompt, params, uuid.uuid4().hex):
+        final = out
+    # Match the transformers backend, which returns prompt + completion
+    completion = final.outputs[0]
+    return req.prompt + completion.text, len(completion.token_ids)
+
+# Only touched from the event loop, so no lock is needed
+resp_cache: LRUCache = LRUCache(maxsize=RESPONSE_CACHE_SIZE)
+
+def _resp_cache_key(req: InferRequest) -> bytes:
+    return hashlib.blake2b(f"{req.max_tokens}|{req.prompt}".encode("utf-8"), digest_size=16).digest()
 
 @app.post("/infer", response_model=InferResponse)
 async def infer(req: InferRequest):
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not ready")
-    # In production, use an async inference queue + batching (see notes below)
-    output = await asyncio.get_event_loop().run_in_executor(None, run_inference_sync, req.prompt, req.max_tokens, req.temperature)
-    return InferResponse(model=MODEL_NAME, output=output, meta={"tokens": len(output.split())})
+    cache_key = _resp_cache_key(req) if req.temperature == 0 and RESPONSE_CACHE_SIZE > 0 else None
+    if cache_key is not None:
+        cached = resp_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    if engine is not None:
+        output, n_tokens = await vllm_generate(req)
+    else:
+        if model is None or _inference_thread is None:
+            raise HTTPException(status_code=503, detail="Model not ready")
+        fut = asyncio.get_running_loop().create_future()
+        request_queue.put_nowait((req, fut, None))
+        output, n_tokens = await fut
+
+    resp = InferResponse(model=MODEL_NAME, output=output, meta={"tokens": n_tokens})
+    if cache_key is not None:
+        resp_cache[cache_key] = resp
+    return resp
+
+async def vllm_stream(req: InferRequest) -> AsyncIterator[str]:
+    params = SamplingParams(max_tokens=req.max_tokens, temperature=req.temperature)
+    sent = 0
+    async for out in engine.generate(req.prompt, params, uuid.uuid4().hex):
+        text = out.outputs[0].text
+        if len(text) > sent:
+            yield text[sent:]
+            sent = len(text)
+
+async def hf_stream(req: InferRequest) -> AsyncIterator[str]:
+    fut = asyncio.get_running_loop().create_future()
+    stream: asyncio.Queue = asyncio.Queue()
+    request_queue.put_nowait((req, fut, stream))
+    try:
+        while (delta := await stream.get()) is not None:
+            yield delta
+        # The worker resolves the future before sending the sentinel, so it is done here
+        exc = fut.exception()
+        if exc is not None:
+            raise exc
+    finally:
+        # Client went away mid-stream: the batcher drops sequences whose future is done
+        fut.cancel()
+
+@app.post("/infer/stream")
+async def infer_stream(req: InferRequest):
+    """
+    Server-sent events: one `data: {"token": ...}` per text delta, then `data: [DONE]`.
+    If generation fails midway, an `event: error` with `data: {"error": ...}` is sent
+    instead of `[DONE]`.
+    """
+    if engine is not None:
+        deltas = vllm_stream(req)
+    else:
+        if model is None or _inference_thread is None:
+            raise HTTPException(status_code=503, detail="Model not ready")
+        deltas = hf_stream(req)
+
+    async def events():
+        try:
+            async for delta in deltas:
+                yield b"data: " + orjson.dumps({"token": delta}) + b"\n\n"
+        except Exception as exc:
+            logger.exception("Streaming inference failed")
+            yield b"event: error\ndata: " + orjson.dumps({"error": str(exc) or type(exc).__name__}) + b"\n\n"
+            return
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     uvicorn.run("model_server:app", host="0.0.0.0", port=PORT, log_level="info")
@@ -0,0 +1,6 @@
+# services/model_server/tests/conftest.py
+import os
+import sys
+
+# model_server is a top-level module, as under uvicorn
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,164 @@
+# services/model_server/tests/test_batcher.py
+import asyncio
+
+import pydantic
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+import model_server as ms
+
+VOCAB = ["<pad>", "<unk>", "</s>"] + [f"w{i}" for i in range(61)]
+
+
+@pytest.fixture
+def tiny_model(monkeypatch):
+    """A randomly initialised two-layer Llama and a word-level tokenizer, installed as the served model."""
+    torch.manual_seed(0)
+    tok = Tokenizer(models.WordLevel({w: i for i, w in enumerate(VOCAB)}, unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, pad_token="<pad>", unk_token="<unk>", eos_token="</s>")
+    tokenizer.padding_side = "left"
+    config = LlamaConfig(
+        vocab_size=len(VOCAB), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+        pad_token_id=0, eos_token_id=None, initializer_range=0.5,  # sharp attention, so KV mix-ups change tokens
+    )
+    model = LlamaForCausalLM(config).eval()
+    monkeypatch.setattr(ms, "tokenizer", tokenizer)
+    monkeypatch.setattr(ms, "model", model)
+    monkeypatch.setattr(ms, "eos_token_ids", set())  # run every sequence to max_tokens
+    return model, tokenizer
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def _prompts():
+    gen = torch.Generator().manual_seed(1)
+    return [
+        " ".join(f"w{int(t)}" for t in torch.randint(0, 61, (n,), generator=gen))
+        for n in (3, 17, 5, 40, 9, 60, 12)
+    ]
+
+
+def _run(batcher, loop, reqs):
+    """Admit every request, decode to completion and return {prompt: generated ids}, {prompt: error}."""
+    finished, failed = batcher.admit([(req, loop.create_future(), None) for req in reqs])
+    while batcher.seqs:
+        finished += batcher.step()
+    return {s.req.prompt: s.generated for s, _ in finished}, {s.req.prompt: exc for s, exc in failed}
+
+
+def test_bucket_by_length(monkeypatch):
+    monkeypatch.setattr(ms, "MAX_BUCKET_LENGTH_RATIO", 1.5)
+    monkeypatch.setattr(ms, "MAX_BATCH_TOKENS", 64)
+    lengths = [10, 30, 12, 14, 16, 40, 31]
+
+    buckets = ms.bucket_by_length(lengths)
+
+    assert sorted(i for b in buckets for i in b) == list(range(len(lengths)))
+    for b in buckets:
+        longest, shortest = max(lengths[i] for i in b), min(lengths[i] for i in b)
+        assert longest <= 1.5 * shortest
+        assert longest * len(b) <= 64
+    assert buckets == [[0, 2, 3], [4], [1, 6], [5]]
+    assert ms.bucket_by_length([]) == []
+
+
+def test_prefix_cache_matches_whole_prefix_only(monkeypatch):
+    monkeypatch.setattr(ms, "PREFIX_BLOCK_SIZE", 4)
+    cache = ms.PrefixCache(max_blocks=8)
+    ids = list(range(10))
+    past = ((torch.arange(10.0).view(1, 1, 10, 1), -torch.arange(10.0).view(1, 1, 10, 1)),)
+
+    cache.insert(ids, past, row=0, start=0)
+
+    assert len(cache.blocks) == 2  # the trailing partial block is not stored
+    cached, kv = cache.match(ids[:8] + [99])
+    assert cached == 8
+    assert kv[0][0].flatten().tolist() == list(range(8))
+    # A full hit still leaves the last prompt token to be forwarded
+    assert cache.match(ids[:8])[0] == 4
+    # The second block's tokens alone do not hit: its key includes everything before it
+    assert cache.match([42, 1, 2, 3] + ids[4:8] + [99]) == (0, None)
+    assert cache.match([0, 1, 2, 3, 42, 5, 6, 7, 8])[0] == 4
+
+
+def test_prefix_cache_evicts_chains_from_the_tail(monkeypatch):
+    monkeypatch.setattr(ms, "PREFIX_BLOCK_SIZE", 2)
+    cache = ms.PrefixCache(max_blocks=3)
+    kv = ((torch.zeros(1, 1, 6, 1), torch.zeros(1, 1, 6, 1)),)
+
+    cache.insert([1, 2, 3, 4, 5, 6], kv, row=0, start=0)
+
+    assert cache.match([1, 2, 3, 4, 5, 6, 7])[0] == 6
+    cache.insert([9, 9], kv, row=0, start=0)
+    assert cache.match([1, 2, 3, 4, 5, 6, 7])[0] == 4
+
+
+@pytest.mark.parametrize("prefix_blocks", [0, 64])
+def test_batcher_matches_generate(tiny_model, loop, monkeypatch, prefix_blocks):
+    model, tokenizer = tiny_model
+    monkeypatch.setattr(ms, "PREFIX_BLOCK_SIZE", 4)
+    monkeypatch.setattr(ms, "prefix_cache", ms.PrefixCache(prefix_blocks) if prefix_blocks else None)
+    monkeypatch.setattr(ms, "MAX_BATCH_SIZE", 4)
+    prompts = _prompts()
+    lengths = [1, 6, 3, 8, 2, 5, 4]
+    reqs = [ms.InferRequest(prompt=p, max_tokens=n) for p, n in zip(prompts, lengths)]
+
+    batcher = ms.ContinuousBatcher()
+    got, failed = _run(batcher, loop, reqs[:4])
+    assert not failed
+    # Later requests join a batch that is already decoding, and hit the prefix cache if on
+    finished, failed = batcher.admit([(req, loop.create_future(), None) for req in reqs[:1] + reqs[4:]])
+    finished += batcher.step()
+    joined, failed_late = batcher.admit([(reqs[1], loop.create_future(), None)])
+    assert not failed and not failed_late
+    finished += joined
+    while batcher.seqs:
+        finished += batcher.step()
+    late = {s.req.prompt: s.generated for s, _ in finished}
+
+    for results in (got, late):
+        for prompt, generated in results.items():
+            n = next(r.max_tokens for r in reqs if r.prompt == prompt)
+            ids = tokenizer(prompt, return_tensors="pt")["input_ids"]
+            expected = model.generate(ids, max_new_tokens=n, do_sample=False, pad_token_id=0)
+            assert generated == expected[0, ids.shape[1]:].tolist(), prompt
+    assert len(got) == 4 and len(late) == 5
+
+
+def test_failed_prefill_fails_only_that_request(tiny_model, loop, monkeypatch):
+    monkeypatch.setattr(ms, "prefix_cache", None)
+    batcher = ms.ContinuousBatcher()
+    prefill = batcher._prefill
+    bad = "w1 w2 w3 w4"
+
+    def flaky_prefill(group):
+        if any(s.req.prompt == bad for s in group):
+            raise RuntimeError("boom")
+        prefill(group)
+
+    monkeypatch.setattr(batcher, "_prefill", flaky_prefill)
+    reqs = [ms.InferRequest(prompt=p, max_tokens=3) for p in ("w5 w6 w7 w8", bad, "w9 w10 w11", "   ")]
+
+    got, failed = _run(batcher, loop, reqs)
+
+    assert set(got) == {"w5 w6 w7 w8", "w9 w10 w11"}
+    assert all(len(ids) == 3 for ids in got.values())
+    assert set(failed) == {bad, "   "}
+    assert isinstance(failed[bad], RuntimeError) and isinstance(failed["   "], ValueError)
+
+
+def test_request_validation():
+    with pytest.raises(pydantic.ValidationError):
+        ms.InferRequest(prompt="")
+    with pytest.raises(pydantic.ValidationError):
+        ms.InferRequest(prompt="hi", max_tokens=0)
+    assert ms.InferRequest(prompt="hi").max_tokens == 512